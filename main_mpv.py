@@ -7,9 +7,19 @@ IPTV плеер на MPV + PySide6 (Optimized)
 
 import sys
 import os
+import re
 import json
-import time
-from typing import Dict, List, Optional
+import tempfile
+import pickle
+import mmap
+import shutil
+import hashlib
+import threading
+from collections import deque, defaultdict, OrderedDict
+from array import array
+from bisect import bisect_right
+from typing import Dict, Final, List, Optional
+from types import MappingProxyType
 from dataclasses import dataclass
 import ctypes
 
@@ -27,25 +37,36 @@ for path in MPV_DIRS:
     if os.path.exists(path):
         os.environ["PATH"] = path + os.pathsep + os.environ["PATH"]
 
-# Импорт MPV
-try:
-    import mpv
-except ImportError:
-    # Пытаемся загрузить dll вручную, если python-mpv не находит в PATH
+# Импорт MPV откладывается до init_mpv: libmpv весит десятки МБ,
+# и окно успевает показаться раньше, чем загрузится библиотека
+mpv = None
+
+def _load_mpv() -> bool:
+    global mpv
+    if mpv is not None:
+        return True
     try:
-        os.environ["PATH"] = os.getcwd() + os.pathsep + os.environ["PATH"]
-        import mpv
-    except ImportError:
-        pass
+        import mpv as _mpv
+    except (ImportError, OSError):
+        # Пытаемся загрузить dll вручную, если python-mpv не находит в PATH
+        try:
+            os.environ["PATH"] = os.getcwd() + os.pathsep + os.environ["PATH"]
+            import mpv as _mpv
+        except (ImportError, OSError):
+            return False
+    mpv = _mpv
+    return True
 
 # Qt Импорты
 from PySide6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
-                               QLabel, QPushButton, QListWidget, QListWidgetItem, QSplitter,
+                               QLabel, QPushButton, QListView, QSplitter,
                                QComboBox, QLineEdit, QFileDialog, QMessageBox, QDialog,
                                QDialogButtonBox, QTabWidget, QProgressBar, QCheckBox, QSlider)
-from PySide6.QtCore import (Qt, QTimer, QSize, QUrl, QByteArray, QBuffer)
-from PySide6.QtGui import QKeyEvent, QAction, QPixmap, QColor, QIcon
-from PySide6.QtNetwork import QNetworkAccessManager, QNetworkRequest, QNetworkReply
+from PySide6.QtCore import (Qt, QEvent, QTimer, QSize, QUrl, QByteArray, QBuffer, Signal,
+                            QObject, QAbstractListModel, QModelIndex, QRunnable, QThreadPool)
+from PySide6.QtGui import QKeyEvent, QAction, QPixmap, QColor, QIcon, QImage, QImageReader
+from PySide6.QtNetwork import (QNetworkAccessManager, QNetworkRequest, QNetworkReply,
+                               QNetworkDiskCache, QSslConfiguration, QSslSocket)
 
 # Иконки (опционально)
 try:
@@ -54,23 +75,77 @@ try:
 except ImportError:
     HAS_QTA = False
 
+# Быстрый JSON (опционально)
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
 # === КОНСТАНТЫ ===
 WINDOW_TITLE = "MaksIPTV Player - MPV Optimized"
 WINDOW_GEOMETRY = (100, 50, 1200, 650)
 PLAYLISTS_JSON = "playlists.json"
-USER_AGENT = b'Mozilla/5.0 (Windows NT 10.0; Win64; x64)'
+PLAYLIST_CACHE_EXT = ".pkl"   # Разобранный плейлист рядом с .m3u
+PLAYLIST_CACHE_VERSION = 4    # Увеличить при изменении Channel/ChannelTable
+USER_AGENT: Final = b'Mozilla/5.0 (Windows NT 10.0; Win64; x64)'
+CHANNEL_ICON_SIZE = 32
+MAX_CACHED_LOGOS = 1024       # Логотипов в памяти (остальные - в дисковом кэше)
+MAX_CONCURRENT_DOWNLOADS = 6  # Одновременных загрузок логотипов
+REQUEST_TIMEOUT_MS = 30000    # Обрыв зависших HTTP-запросов
+VOLUME_DEBOUNCE_MS = 50  # Пауза перед отправкой громкости в MPV
+AUTOUPDATE_DELAY_MS = 1000  # Автообновление плейлиста - после того как окно отрисовано
+SAVE_DEBOUNCE_MS = 500   # Серия изменений плейлистов пишется в JSON одним разом
+MPV_TERMINATE_TIMEOUT_S = 2.0  # Сколько ждать остановки MPV при закрытии окна
+ICON_BATCH_MS = 50       # Окно накопления загруженных логотипов перед перерисовкой
+CATEGORY_ALL = "Все каналы"
+CATEGORY_NONE = "Разное"
+
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'maksiptv')
+SHADER_CACHE_DIR = os.path.join(CACHE_DIR, 'shaders')
+LOGO_CACHE_DIR = os.path.join(CACHE_DIR, 'icons')  # Логотипы между запусками
+LOGO_CACHE_MAX_BYTES = 50 * 1024 * 1024
+HTTP_CACHE_DIR = os.path.join(CACHE_DIR, 'http')  # HTTP-кэш QNAM (ETag/Last-Modified плейлистов)
+HTTP_CACHE_MAX_BYTES = 50 * 1024 * 1024
 
-COLORS = {
+# Неизменяемые таблицы: случайная правка в рантайме не разойдется со стилями и MPV
+COLORS = MappingProxyType({
     'bg': '#2a2a2a', 'bg_alt': '#383838', 'panel': '#2d2d2d',
     'accent': '#4080b0', 'text': 'white', 'text_dim': '#a0a0a0',
     'btn': '#3a3a3a', 'btn_border': '#555', 'btn_hover': '#4a4a4a'
-}
+})
+
+# Единая таблица стилей: форматируется один раз и ставится на QApplication
+STYLESHEET: Final = """
+    QWidget {{ background-color: {bg}; color: {text}; }}
+    QPushButton {{
+        background-color: {btn}; border: 1px solid {btn_border};
+        border-radius: 4px; padding: 6px; color: {text}; min-width: 30px;
+    }}
+    QPushButton:hover {{ background-color: {btn_hover}; }}
+    QPushButton:pressed {{ background-color: {bg}; }}
+    QComboBox, QLineEdit {{ background: {btn}; color: {text}; border: 1px solid {btn_border}; }}
+    QListView {{ background: {bg_alt}; border: none; }}
+    QListView::item:selected {{ background: {accent}; }}
+    QLabel#channelTitle {{ font-size: 14pt; font-weight: bold; padding: 5px; }}
+    QWidget#videoFrame {{ background: black; }}
+""".format(**COLORS)
 
-MPV_SETTINGS = {
+_mpv_settings = {
     'keep_open': 'yes', 'idle': 'yes', 'osc': 'no',
-    'cache': 'yes', 'demuxer_max_bytes': '150M',
-    'hwdec': 'auto', 'vo': 'gpu', 'msg_level': 'all=error'
+    'input_default_bindings': 'no', 'input_vo_keyboard': 'no',  # Клавиши обрабатывает Qt
+    'cache': 'yes', 'demuxer_max_bytes': '150M', 'demuxer_max_back_bytes': '75M',
+    'hwdec': 'auto-safe', 'hwdec_codecs': 'all', 'vd_lavc_dr': 'yes',
+    'vo': 'gpu-next', 'gpu_shader_cache_dir': SHADER_CACHE_DIR,
+    # Переподключение при обрыве потока вместо остановки воспроизведения
+    'demuxer_lavf_o': 'reconnect=1,reconnect_streamed=1,reconnect_delay_max=2,rw_timeout=5000000',
+    'cache_secs': '10', 'stream_buffer_size': '4MiB',
+    'msg_level': 'all=no'
 }
+# Windows: декодирование D3D11VA и вывод через D3D11 без копирования кадров через ОЗУ
+if sys.platform == 'win32':
+    _mpv_settings.update({'gpu_api': 'd3d11', 'gpu_context': 'd3d11'})
+MPV_SETTINGS = MappingProxyType(_mpv_settings)
 
 # === МОДЕЛИ ===
 @dataclass
@@ -81,38 +156,642 @@ class Channel:
     group: str
     logo: Optional[str]
 
+    def __reduce__(self):
+        # В pickle - просто кортеж полей: кэш плейлиста меньше и грузится быстрее
+        return (Channel, (self.name, self.url, self.group, self.logo))
+
+
+class ChannelTable:
+    """Каналы плейлиста + колоночные (SoA) индексы для быстрой фильтрации"""
+    __slots__ = ('channels', 'groups', 'group_idx', '_group_ids', '_group_rows', '_flat', '_starts')
+
+    def __init__(self, channels: List[Channel]):
+        self.channels = channels
+        self.group_idx = array('i')   # Номер группы для каждого канала
+        self._group_ids: Dict[str, int] = {}
+        group_rows = defaultdict(list)
+
+        # Один проход: номер группы и список строк каждой группы
+        for i, ch in enumerate(channels):
+            rows = group_rows[ch.group]
+            if not rows:
+                self._group_ids[ch.group] = len(self._group_ids)
+            rows.append(i)
+            self.group_idx.append(self._group_ids[ch.group])
+
+        self._group_rows: Dict[str, List[int]] = dict(group_rows)
+        self.groups: List[str] = list(self._group_rows)  # Уникальные группы
+
+        # Имена в нижнем регистре одной строкой через \n + смещения начала каждого имени:
+        # поиск подстроки идет через str.find на C, а не циклом Python по всем каналам
+        names = [ch.name.lower() for ch in channels]
+        self._flat = "\n".join(names)
+        self._starts = array('i')
+        pos = 0
+        for n in names:
+            self._starts.append(pos)
+            pos += len(n) + 1
+
+    def __len__(self):
+        return len(self.channels)
+
+    def count(self, group: Optional[str] = None) -> int:
+        """Число каналов группы (None - все каналы)"""
+        if group is None:
+            return len(self.channels)
+        return len(self._group_rows.get(group, ()))
+
+    def rows(self, group: Optional[str] = None) -> List[int]:
+        """Индексы каналов группы (None - все каналы)"""
+        if group is None:
+            return list(range(len(self.channels)))
+        return list(self._group_rows.get(group, ()))
+
+    def search(self, text: str, group: Optional[str] = None) -> List[int]:
+        """Индексы каналов группы (None - все), в имени которых есть text (нижний регистр)"""
+        if not text:
+            return self.rows(group)
+        if "\n" in text:
+            return []  # \n - разделитель в буфере, в именах его нет
+        gid = None
+        if group is not None:
+            gid = self._group_ids.get(group)
+            if gid is None:
+                return []
+
+        flat, starts, group_idx = self._flat, self._starts, self.group_idx
+        last = len(starts) - 1
+        result = []
+        pos = flat.find(text)
+        while pos != -1:
+            i = bisect_right(starts, pos) - 1
+            if gid is None or group_idx[i] == gid:
+                result.append(i)
+            if i == last:
+                break
+            # Следующее совпадение ищем уже в следующем имени
+            pos = flat.find(text, starts[i + 1])
+        return result
+
+
 # === УТИЛИТЫ ===
+class IconCache:
+    """Общий кэш иконок: каждый глиф/логотип создается один раз на процесс"""
+    _icons: Dict[tuple, QIcon] = {}
+    # Логотипы - LRU: при долгой работе и смене плейлистов память не растет без предела,
+    # вытесненный логотип быстро поднимается из дискового кэша
+    _logos: "OrderedDict[str, QIcon]" = OrderedDict()
+
+    @classmethod
+    def qta(cls, name, color='white'):
+        key = ('qta', name, color)
+        icon = cls._icons.get(key)
+        if icon is None:
+            icon = qta.icon(name, color=color) if HAS_QTA else QIcon()
+            cls._icons[key] = icon
+        return icon
+
+    @classmethod
+    def file(cls, path):
+        key = ('file', path)
+        icon = cls._icons.get(key)
+        if icon is None:
+            icon = QIcon(path)
+            cls._icons[key] = icon
+        return icon
+
+    @classmethod
+    def blank(cls, size=CHANNEL_ICON_SIZE):
+        """Прозрачная заглушка до загрузки логотипа"""
+        key = ('blank', size)
+        icon = cls._icons.get(key)
+        if icon is None:
+            pix = QPixmap(size, size)
+            pix.fill(Qt.transparent)
+            icon = QIcon(pix)
+            cls._icons[key] = icon
+        return icon
+
+    @classmethod
+    def logo(cls, url) -> Optional[QIcon]:
+        icon = cls._logos.get(url)
+        if icon is not None:
+            cls._logos.move_to_end(url)
+        return icon
+
+    @classmethod
+    def set_logo(cls, url, pix: QPixmap) -> QIcon:
+        icon = QIcon(pix)
+        cls._logos[url] = icon
+        cls._logos.move_to_end(url)
+        if len(cls._logos) > MAX_CACHED_LOGOS:
+            cls._logos.popitem(last=False)
+        return icon
+
+def write_atomic(path, data: bytes):
+    """Запись через временный файл: при сбое старая версия файла остается целой"""
+    fd, tmp = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except Exception:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+_NO_VERIFY_SSL: Optional[QSslConfiguration] = None
+
+def _no_verify_ssl() -> QSslConfiguration:
+    """Одна общая TLS-конфигурация без проверки сертификата
+    (у IPTV провайдеров логотипы часто на хостах с битыми сертификатами)"""
+    global _NO_VERIFY_SSL
+    if _NO_VERIFY_SSL is None:
+        _NO_VERIFY_SSL = QSslConfiguration.defaultConfiguration()
+        _NO_VERIFY_SSL.setPeerVerifyMode(QSslSocket.VerifyNone)
+    return _NO_VERIFY_SSL
+
+_REQUEST_TEMPLATES: Dict[bool, QNetworkRequest] = {}
+
+def _request_template(verify_ssl) -> QNetworkRequest:
+    """Общие параметры HTTP-запросов для плейлистов и логотипов, настраиваются один раз"""
+    tpl = _REQUEST_TEMPLATES.get(verify_ssl)
+    if tpl is None:
+        tpl = QNetworkRequest()
+        tpl.setRawHeader(b"User-Agent", USER_AGENT)
+        # Принудительно отключаем HTTP/2 (используем HTTP/1.1)
+        tpl.setAttribute(QNetworkRequest.Attribute.Http2AllowedAttribute, False)
+        # Зависшее соединение не должно занимать слот пула бесконечно
+        tpl.setTransferTimeout(REQUEST_TIMEOUT_MS)
+        if not verify_ssl:
+            tpl.setSslConfiguration(_no_verify_ssl())
+        _REQUEST_TEMPLATES[verify_ssl] = tpl
+    return tpl
+
+def make_request(url, verify_ssl=True) -> QNetworkRequest:
+    # Копия QNetworkRequest разделяет данные с шаблоном до первого изменения
+    req = QNetworkRequest(_request_template(verify_ssl))
+    req.setUrl(QUrl(url))
+    return req
+
+def _require_revalidation(cache, url: QUrl):
+    """Помечает кэшированный ответ как no-cache: Qt не отдаст его по эвристике
+    свежести (Last-Modified), а переспросит сервер с If-None-Match/If-Modified-Since"""
+    meta = cache.metaData(url) if cache else None
+    if meta is None or not meta.isValid():
+        return
+    headers = [(k, v) for k, v in meta.rawHeaders() if bytes(k).lower() != b'cache-control']
+    headers.append((QByteArray(b'Cache-Control'), QByteArray(b'no-cache')))
+    meta.setRawHeaders(headers)
+    cache.updateMetaData(meta)
+
+def load_json(path):
+    with open(path, 'rb') as f:
+        raw = f.read()
+    return orjson.loads(raw) if HAS_ORJSON else json.loads(raw)
+
+def dump_json(data) -> bytes:
+    if HAS_ORJSON:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2)
+    return json.dumps(data, indent=2, ensure_ascii=False).encode('utf-8')
+
+def next_playlist_filename(prefix) -> str:
+    """Свободное имя prefix_N.m3u: один просмотр каталога вместо проверки имен по одному"""
+    pattern = re.compile(re.escape(prefix) + r'_(\d+)\.m3u$')
+    nums = [int(m.group(1)) for m in map(pattern.match, os.listdir('.')) if m]
+    return f"{prefix}_{max(nums, default=0) + 1}.m3u"
+
 def make_btn(text, func=None, tip=None, icon=None):
-    btn = QPushButton()
+    btn = QPushButton(text)
     if HAS_QTA and icon:
-        btn.setIcon(qta.icon(icon, color='white'))
+        # Глиф qtawesome ставится после показа окна (MPVPlayer._populate_icons),
+        # до этого на кнопке текстовый символ
+        btn.setProperty('qta_icon', icon)
         btn.setToolTip(tip or text)
     else:
-        btn.setText(text)
         btn.setToolTip(tip)
     
     if func:
         btn.clicked.connect(func)
     
-    btn.setStyleSheet(f"""
-        QPushButton {{
-            background-color: {COLORS['btn']}; border: 1px solid {COLORS['btn_border']};
-            border-radius: 4px; padding: 6px; color: {COLORS['text']}; min-width: 30px;
-        }}
-        QPushButton:hover {{ background-color: {COLORS['btn_hover']}; }}
-        QPushButton:pressed {{ background-color: {COLORS['bg']}; }}
-    """)
     return btn
 
+# === ПАРСИНГ M3U ===
+# #EXTINF:<длительность> key="value" ...,<имя>  (запятые внутри кавычек не считаются)
+_EXTINF_RE = re.compile(rb'#EXTINF:\s*(-?[\d.]+)((?:[^,"]|"[^"]*")*),(.*)')
+_ATTR_RE = re.compile(rb'([\w-]+)="([^"]*)"')
+
+def _decode(raw: bytes) -> str:
+    return raw.decode('utf-8', 'ignore')
+
+def _find_attr(line: bytes, prefix: bytes) -> Optional[bytes]:
+    """Значение от prefix до следующей кавычки; None - атрибута нет"""
+    start = line.find(prefix)
+    if start == -1:
+        return None
+    start += len(prefix)
+    return line[start:line.find(b'"', start)]
+
+def parse_m3u(lines) -> List[Channel]:
+    """Разбор строк M3U (bytes) в список каналов.
+    Декодируются только сохраняемые поля, служебные строки пропускаются как есть."""
+    channels = []
+    name, group, logo = None, CATEGORY_NONE, None
+    # Локальные ссылки: в цикле на тысячи строк поиск атрибутов заметен
+    append, make = channels.append, Channel
+    match_extinf, find_attrs = _EXTINF_RE.match, _ATTR_RE.findall
+    decode, intern = _decode, sys.intern
+    # Сырые байты -> строка: повторяющиеся группы и логотипы декодируются
+    # один раз и разделяют один объект str на все каналы
+    groups: Dict[bytes, str] = {}
+    logos: Dict[bytes, str] = {}
+
+    for line in lines:
+        line = line.strip()
+        if not line: continue
+
+        if line[0] == 35:  # b'#': одна проверка вместо двух startswith для строк URL
+            if line[:7] != b"#EXTINF":
+                continue  # Прочие теги (#EXTM3U, #EXTVLCOPT, ...) пропускаем
+            m = match_extinf(line)
+            if m:
+                attrs = dict(find_attrs(m.group(2)))
+                name = decode(m.group(3).strip())
+            else:
+                # Нестандартная строка (нет запятой, незакрытая кавычка):
+                # группу и логотип ищем простым find, как исходный парсер
+                attrs = {b'group-title': _find_attr(line, b'group-title="'),
+                         b'tvg-logo': _find_attr(line, b'tvg-logo="')}
+                comma = line.rfind(b',')
+                name = decode(line[comma+1:].strip()) if comma != -1 else "Неизвестный канал"
+            raw_group = attrs.get(b'group-title')
+            if raw_group is None:
+                group = CATEGORY_NONE
+            else:
+                group = groups.get(raw_group)
+                if group is None:
+                    group = groups[raw_group] = intern(decode(raw_group))
+            raw_logo = attrs.get(b'tvg-logo')
+            if raw_logo:
+                logo = logos.get(raw_logo)
+                if logo is None:
+                    logo = logos[raw_logo] = decode(raw_logo)
+            else:
+                logo = None
+
+        elif name:
+            append(make(name, decode(line), group, logo))
+            name = None # Сброс
+
+    return channels
+
+def read_m3u(filename) -> List[Channel]:
+    """Парсинг файла через mmap: ОС подгружает страницы по мере чтения,
+    без копии всего файла в памяти Python"""
+    with open(filename, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return []  # mmap не умеет отображать пустые файлы
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return parse_m3u(iter(mm.readline, b''))
+
+
+class _PlaylistSignals(QObject):
+    loaded = Signal(str, object)  # имя файла, ChannelTable
+    failed = Signal(str, str)     # имя файла, текст ошибки
+    imported = Signal(str, str, str)  # имя файла, название, текст ошибки ('' - успешно)
+
+
+class PlaylistImportTask(QRunnable):
+    """Копирование локального плейлиста в папку программы вне GUI-потока"""
+
+    def __init__(self, src, filename, name, signals: _PlaylistSignals):
+        super().__init__()
+        self.src = src
+        self.filename = filename
+        self.name = name
+        self.signals = signals
+
+    def run(self):
+        try:
+            shutil.copyfile(self.src, self.filename)
+            error = ''
+        except OSError as e:
+            error = str(e)
+        self.signals.imported.emit(self.filename, self.name, error)
+
+
+class PlaylistLoadTask(QRunnable):
+    """Чтение и парсинг M3U в пуле потоков, чтобы не блокировать UI.
+    Результат кэшируется в pickle рядом с плейлистом и используется,
+    пока у .m3u те же время изменения и размер."""
+
+    def __init__(self, filename, signals: _PlaylistSignals):
+        super().__init__()
+        self.filename = filename
+        self.cache_path = filename + PLAYLIST_CACHE_EXT
+        self.signals = signals
+
+    def run(self):
+        try:
+            st = os.stat(self.filename)
+            key = (PLAYLIST_CACHE_VERSION, st.st_mtime_ns, st.st_size)
+            table = self._load_cache(key)
+            if table is None:
+                table = ChannelTable(read_m3u(self.filename))
+                self._save_cache(key, table)
+        except Exception as e:
+            self.signals.failed.emit(self.filename, str(e))
+            return
+        self.signals.loaded.emit(self.filename, table)
+
+    def _load_cache(self, key) -> Optional[ChannelTable]:
+        try:
+            with open(self.cache_path, 'rb') as f:
+                cached_key, table = pickle.load(f)
+            return table if cached_key == key else None
+        except Exception:
+            # Нет кэша или он поврежден - просто парсим заново
+            return None
+
+    def _save_cache(self, key, table: ChannelTable):
+        try:
+            payload = pickle.dumps((key, table), protocol=pickle.HIGHEST_PROTOCOL)
+            write_atomic(self.cache_path, payload)
+        except Exception as e:
+            print(f"Playlist cache error: {e}")
+
+# === ЗАГРУЗКА ЛОГОТИПОВ ===
+def logo_cache_path(url) -> str:
+    key = hashlib.blake2b(url.encode('utf-8'), digest_size=16).hexdigest()
+    return os.path.join(LOGO_CACHE_DIR, key + '.png')
+
+
+class _LogoSignals(QObject):
+    decoded = Signal(str, QImage, bool)  # URL, картинка, из дискового кэша
+
+
+class LogoDecodeTask(QRunnable):
+    """Декодирование и масштабирование PNG/JPEG в пуле потоков: QImage,
+    в отличие от QPixmap, можно создавать вне GUI-потока. data=None - читать из дискового кэша,
+    иначе скачанный логотип сохраняется в кэш."""
+
+    def __init__(self, url, data: Optional[QByteArray], signals: _LogoSignals):
+        super().__init__()
+        self.url = url
+        self.data = data
+        self.signals = signals
+
+    def run(self):
+        path = logo_cache_path(self.url)
+        from_disk = self.data is None
+        if from_disk:
+            image = self._read(path)
+            if image.isNull():
+                self._remove(path)  # Битый файл - скачаем заново
+            else:
+                self._touch(path)
+        else:
+            buf = QBuffer()
+            buf.setData(self.data)
+            buf.open(QBuffer.ReadOnly)
+            image = self._read(buf)
+            if not image.isNull():
+                image = self._scaled(image)
+                self._store(image, path)
+        self.signals.decoded.emit(self.url, image, from_disk)
+
+    @staticmethod
+    def _read(source) -> QImage:
+        # Размер задаем до декодирования: JPEG сразу читается уменьшенным,
+        # большой логотип не разворачивается в памяти целиком
+        reader = QImageReader(source)
+        reader.setAutoTransform(True)
+        size = reader.size()
+        if size.isValid() and (size.width() > CHANNEL_ICON_SIZE or size.height() > CHANNEL_ICON_SIZE):
+            reader.setScaledSize(size.scaled(CHANNEL_ICON_SIZE, CHANNEL_ICON_SIZE, Qt.KeepAspectRatio))
+        return reader.read()
+
+    @staticmethod
+    def _scaled(image: QImage) -> QImage:
+        # Формат не сообщил размер заранее - уменьшаем после декодирования
+        if image.width() <= CHANNEL_ICON_SIZE and image.height() <= CHANNEL_ICON_SIZE:
+            return image
+        return image.scaled(CHANNEL_ICON_SIZE, CHANNEL_ICON_SIZE,
+                            Qt.KeepAspectRatio, Qt.SmoothTransformation)
+
+    @staticmethod
+    def _store(image: QImage, path):
+        try:
+            buf = QBuffer()
+            buf.open(QBuffer.WriteOnly)
+            image.save(buf, 'PNG')
+            write_atomic(path, buf.data().data())
+        except OSError as e:
+            print(f"Logo cache error: {e}")
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    @staticmethod
+    def _touch(path):
+        # mtime - время последнего использования, по нему чистится кэш
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+
+class LogoCachePruneTask(QRunnable):
+    """Удаляет давно не использованные логотипы, пока кэш больше лимита"""
+
+    def run(self):
+        try:
+            entries = [(e.stat().st_mtime, e.stat().st_size, e.path)
+                       for e in os.scandir(LOGO_CACHE_DIR) if e.is_file()]
+        except OSError:
+            return
+        total = sum(size for _, size, _ in entries)
+        if total <= LOGO_CACHE_MAX_BYTES:
+            return
+        entries.sort()
+        for _, size, path in entries:
+            LogoDecodeTask._remove(path)
+            total -= size
+            if total <= LOGO_CACHE_MAX_BYTES:
+                break
+
+
+class IconDownloader(QObject):
+    """Очередь загрузки логотипов через общий QNetworkAccessManager.
+    Соединения переиспользуются QNAM (keep-alive), а число одновременных
+    запросов ограничено MAX_CONCURRENT_DOWNLOADS. Очередь обслуживается
+    с конца: при прокрутке сначала грузятся логотипы на экране.
+    Декодирование идет в отдельном пуле потоков."""
+
+    def __init__(self, nam: QNetworkAccessManager, parent=None):
+        super().__init__(parent)
+        self.nam = nam
+        self._queue = deque()
+        self._replies = set()  # Запросы в полете
+        # URL -> callbacks: каналы с общим логотипом ждут одну загрузку
+        self._pending: Dict[str, list] = {}
+
+        self._pool = QThreadPool(self)
+        self._pool.setMaxThreadCount(MAX_CONCURRENT_DOWNLOADS)
+        self._signals = _LogoSignals(self)
+        self._signals.decoded.connect(self._on_decoded)
+        os.makedirs(LOGO_CACHE_DIR, exist_ok=True)
+        self._pool.start(LogoCachePruneTask())
+
+    def queue_icon(self, url, callback):
+        """callback(url, icon) вызывается в GUI-потоке после успешной загрузки"""
+        callbacks = self._pending.get(url)
+        if callbacks is not None:
+            callbacks.append(callback)
+            return
+        self._pending[url] = [callback]
+
+        if os.path.exists(logo_cache_path(url)):
+            # Логотип уже скачивался в прошлых запусках - без сети
+            self._pool.start(LogoDecodeTask(url, None, self._signals))
+            return
+        self._queue.append(url)
+        self._pump()
+
+    def cancel_queued(self):
+        """Снимает с очереди еще не начатые загрузки: после смены фильтра
+        видимые строки запросят свои логотипы заново"""
+        for url in self._queue:
+            self._pending.pop(url, None)
+        self._queue.clear()
+
+    def cancel_all(self):
+        """Смена плейлиста: кроме очереди прерываем и начатые загрузки"""
+        self.cancel_queued()
+        for reply in list(self._replies):
+            reply.abort()  # finished придет с OperationCanceledError
+
+    def _pump(self):
+        while len(self._replies) < MAX_CONCURRENT_DOWNLOADS and self._queue:
+            url = self._queue.pop()  # Свежие запросы - строки, видимые сейчас
+
+            req = make_request(url, verify_ssl=False)
+            # У логотипов свой кэш в LOGO_CACHE_DIR - в HTTP-кэш их не дублируем
+            req.setAttribute(QNetworkRequest.Attribute.CacheSaveControlAttribute, False)
+            reply = self.nam.get(req)
+            reply.setProperty('logo_url', url)
+            self._replies.add(reply)
+            # Один слот на все ответы: ответ берем из sender(), без замыкания на каждый запрос
+            reply.finished.connect(self._on_finished)
+
+    def _on_finished(self):
+        reply: QNetworkReply = self.sender()
+        url = reply.property('logo_url')
+        self._replies.discard(reply)
+        if reply.error() == QNetworkReply.NoError:
+            self._pool.start(LogoDecodeTask(url, reply.readAll(), self._signals))
+        else:
+            self._pending.pop(url, None)
+        self._pump()
+
+    def _on_decoded(self, url, image: QImage, from_disk):
+        if not image.isNull():
+            icon = IconCache.set_logo(url, QPixmap.fromImage(image))
+            for callback in self._pending.pop(url, ()):
+                callback(url, icon)
+        elif from_disk:
+            self._queue.append(url)
+            self._pump()
+        else:
+            self._pending.pop(url, None)
+
+# === МОДЕЛЬ СПИСКА КАНАЛОВ ===
+class ChannelModel(QAbstractListModel):
+    """Строки списка - индексы в ChannelTable. QListView запрашивает data()
+    только для видимых строк, поэтому логотипы грузятся по мере прокрутки."""
+
+    def __init__(self, downloader: IconDownloader, parent=None):
+        super().__init__(parent)
+        self.table = ChannelTable([])
+        self._rows: List[int] = []
+        self._downloader = downloader
+        self._waiting: Dict[str, List[int]] = {}  # URL логотипа -> строки, ждущие его
+
+        # Логотипы приходят пачками: перерисовываем строки раз в ICON_BATCH_MS
+        self._ready_rows: List[int] = []
+        self._ready_timer = QTimer(self)
+        self._ready_timer.setSingleShot(True)
+        self._ready_timer.setInterval(ICON_BATCH_MS)
+        self._ready_timer.timeout.connect(self._flush_ready)
+
+    def set_rows(self, table: ChannelTable, rows: List[int]):
+        # Результат фильтра не изменился - сохраняем прокрутку, выделение и очередь логотипов
+        if table is self.table and rows == self._rows:
+            return
+        self.beginResetModel()
+        self.table = table
+        self._rows = rows
+        self._waiting.clear()
+        self._downloader.cancel_queued()
+        self._ready_rows.clear()
+        self._ready_timer.stop()
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        ch = self.table.channels[self._rows[index.row()]]
+
+        if role == Qt.DisplayRole:
+            return ch.name
+        if role == Qt.DecorationRole:
+            if ch.logo:
+                icon = IconCache.logo(ch.logo)
+                if icon is not None:
+                    return icon
+                self._request_logo(ch.logo, index.row())
+            return IconCache.blank()
+        if role == Qt.UserRole:
+            return ch
+        return None
+
+    def _request_logo(self, url, row):
+        rows = self._waiting.get(url)
+        if rows is None:
+            self._waiting[url] = [row]
+            self._downloader.queue_icon(url, self._on_logo_loaded)
+        elif row not in rows:
+            rows.append(row)
+
+    def _on_logo_loaded(self, url, icon):
+        rows = self._waiting.pop(url, None)
+        if rows:
+            self._ready_rows.extend(rows)
+            if not self._ready_timer.isActive():
+                self._ready_timer.start()
+
+    def _flush_ready(self):
+        if not self._ready_rows:
+            return
+        # Один dataChanged на весь диапазон вместо сигнала на каждую строку
+        top, bottom = min(self._ready_rows), max(self._ready_rows)
+        self._ready_rows.clear()
+        self.dataChanged.emit(self.index(top), self.index(bottom), [Qt.DecorationRole])
+
 # === ГЛАВНЫЙ КЛАСС ===
 class MPVPlayer(QMainWindow):
+    # События MPV приходят из его собственного потока; сигнал доставляет их в GUI-поток
+    file_loaded = Signal()
+
     def __init__(self):
         super().__init__()
-        
-        # Проверка наличия MPV
-        if 'mpv' not in sys.modules:
-            QMessageBox.critical(self, "Ошибка", "Библиотека mpv не найдена!\nУстановите: pip install python-mpv\nИ скачайте mpv.dll/exe")
-            sys.exit(1)
 
         self._setup_window()
         self._init_variables()
@@ -120,22 +799,30 @@ class MPVPlayer(QMainWindow):
         self.init_ui()
         
         # Отложенная инициализация тяжелых компонентов
+        QTimer.singleShot(50, self._populate_icons)
         QTimer.singleShot(100, self.init_mpv)
         QTimer.singleShot(200, self.load_playlists_data)
 
+    def _populate_icons(self):
+        """Иконки кнопок: загрузка шрифта FontAwesome не задерживает первый кадр"""
+        for btn in self.findChildren(QPushButton):
+            name = btn.property('qta_icon')
+            if name:
+                btn.setIcon(IconCache.qta(name))
+                btn.setText("")
+
     def _setup_window(self):
         self.setWindowTitle(WINDOW_TITLE)
         self.setGeometry(*WINDOW_GEOMETRY)
         self.setMinimumSize(800, 600)
-        self.setStyleSheet(f"background-color: {COLORS['bg']}; color: {COLORS['text']};")
         icon_path = os.path.join(SCRIPT_DIR, "iptv.ico")
         if os.path.exists(icon_path):
-            self.setWindowIcon(QIcon(icon_path))
+            self.setWindowIcon(IconCache.file(icon_path))
 
     def _init_variables(self):
-        self.channels: List[Channel] = []
-        self.categories: Dict[str, List[Channel]] = {"Все каналы": []}
+        self.table = ChannelTable([])
         self.playlists_data = {}
+        self._loading_playlist = None
         
         # Состояние
         self.is_fullscreen = False
@@ -144,9 +831,6 @@ class MPVPlayer(QMainWindow):
         self.was_maximized = False
         self.previous_geometry = None
         
-        # Кэш иконок
-        self.icon_cache = {}
-        self.default_icon = self._create_default_icon()
         
         # Таймер для поиска (debounce)
         self.search_timer = QTimer()
@@ -154,27 +838,74 @@ class MPVPlayer(QMainWindow):
         self.search_timer.setInterval(300) # 300мс задержка
         self.search_timer.timeout.connect(self._perform_filter)
 
+        # Таймер громкости: в MPV уходит только последнее значение ползунка
+        self._pending_vol = None
+        self._vol_timer = QTimer(self)
+        self._vol_timer.setSingleShot(True)
+        self._vol_timer.setInterval(VOLUME_DEBOUNCE_MS)
+        self._vol_timer.timeout.connect(self._flush_volume)
+
+        # Парсинг плейлистов: один поток, устаревшие задачи снимаются с очереди
+        self._playlist_pool = QThreadPool(self)
+        self._playlist_pool.setMaxThreadCount(1)
+        self._playlist_signals = _PlaylistSignals(self)
+        self._playlist_signals.loaded.connect(self._on_playlist_loaded)
+        self._playlist_signals.failed.connect(self._on_playlist_failed)
+        self._playlist_signals.imported.connect(self._on_playlist_imported)
+        # Импорт - в своем пуле: clear() при смене плейлиста не должен снимать копирование
+        self._import_pool = QThreadPool(self)
+        self._importing = set()  # Зарезервированные local_N.m3u, копия которых еще не дошла
+
+        # Таймер сохранения: несколько изменений подряд - одна запись playlists.json
+        self._last_playlist: Optional[str] = None  # Хранится здесь, чтобы не перечитывать JSON
+        self._saved_digest = None  # Хэш последнего записанного содержимого
+        self._save_timer = QTimer(self)
+        self._save_timer.setSingleShot(True)
+        self._save_timer.setInterval(SAVE_DEBOUNCE_MS)
+        self._save_timer.timeout.connect(self._flush_state)
+
     def _init_network(self):
         """Инициализация сетевого менеджера Qt"""
         self.nam = QNetworkAccessManager(self)
+        self.nam.setAutoDeleteReplies(True)  # Ответы удаляются после finished
+        # Логотипы берутся из кэша, плейлист всегда сверяется с сервером (304 вместо полной закачки)
+        disk_cache = QNetworkDiskCache(self.nam)
+        disk_cache.setCacheDirectory(HTTP_CACHE_DIR)
+        disk_cache.setMaximumCacheSize(HTTP_CACHE_MAX_BYTES)
+        self.nam.setCache(disk_cache)
+        self.icon_downloader = IconDownloader(self.nam, self)
 
     def init_mpv(self):
         """Инициализация движка MPV"""
+        if not _load_mpv():
+            QMessageBox.critical(self, "Ошибка", "Библиотека mpv не найдена!\nУстановите: pip install python-mpv\nИ скачайте mpv.dll/exe")
+            QApplication.exit(1)
+            return
         try:
             wid = str(int(self.video_frame.winId()))
-            self.mpv_player = mpv.MPV(wid=wid, **MPV_SETTINGS)
+            os.makedirs(SHADER_CACHE_DIR, exist_ok=True)
+            try:
+                self.mpv_player = mpv.MPV(wid=wid, **MPV_SETTINGS)
+            except Exception:
+                # Старые сборки libmpv (mpv-1.dll) не знают vo=gpu-next
+                self.mpv_player = mpv.MPV(wid=wid, **{**MPV_SETTINGS, 'vo': 'gpu'})
             start_vol = self.vol_slider.value()
             self.mpv_player.volume = start_vol
             
+            self.file_loaded.connect(self._on_file_loaded)
+
             @self.mpv_player.event_callback('file-loaded')
             def on_load(event):
-                QTimer.singleShot(0, lambda: self.status_label.setText(f"Играет: {self.current_channel}"))
-                QTimer.singleShot(0, lambda: self.progress_bar.setVisible(False))
+                self.file_loaded.emit()
 
         except Exception as e:
             self.status_label.setText(f"Ошибка MPV: {e}")
             print(f"MPV Init Error: {e}")
 
+    def _on_file_loaded(self):
+        self.status_label.setText(f"Играет: {self.current_channel}")
+        self.progress_bar.setVisible(False)
+
     # === UI CONSTRUCTION ===
     def init_ui(self):
         central = QWidget()
@@ -198,7 +929,6 @@ class MPVPlayer(QMainWindow):
         cat_box = QHBoxLayout()
         self.combo_cat = QComboBox()
         self.combo_cat.currentTextChanged.connect(self.filter_channels)
-        self.combo_cat.setStyleSheet(f"background: {COLORS['btn']}; color: white; border: 1px solid #555;")
         cat_box.addWidget(QLabel("Кат:"))
         cat_box.addWidget(self.combo_cat, 1)
         left_layout.addLayout(cat_box)
@@ -207,21 +937,21 @@ class MPVPlayer(QMainWindow):
         search_box = QHBoxLayout()
         self.search_input = QLineEdit()
         self.search_input.setPlaceholderText("Поиск...")
-        self.search_input.setStyleSheet(f"background: {COLORS['btn']}; color: white; border: 1px solid #555;")
         self.search_input.textChanged.connect(self.search_timer.start)
         search_box.addWidget(QLabel("🔍"))
         search_box.addWidget(self.search_input, 1)
         left_layout.addLayout(search_box)
 
         # Список каналов
-        self.list_widget = QListWidget()
-        self.list_widget.setIconSize(QSize(32, 32))
-        self.list_widget.setStyleSheet(f"""
-            QListWidget {{ background: {COLORS['bg_alt']}; border: none; }}
-            QListWidget::item:selected {{ background: {COLORS['accent']}; }}
-        """)
-        self.list_widget.itemDoubleClicked.connect(self.on_channel_click)
-        left_layout.addWidget(self.list_widget)
+        self.channel_model = ChannelModel(self.icon_downloader, self)
+        self.list_view = QListView()
+        self.list_view.setModel(self.channel_model)
+        self.list_view.setUniformItemSizes(True)
+        self.list_view.setLayoutMode(QListView.Batched)
+        self.list_view.setBatchSize(200)  # Строк за один проход раскладки
+        self.list_view.setIconSize(QSize(CHANNEL_ICON_SIZE, CHANNEL_ICON_SIZE))
+        self.list_view.doubleClicked.connect(self.on_channel_click)
+        left_layout.addWidget(self.list_view)
         
         self.lbl_count = QLabel("0 каналов")
         left_layout.addWidget(self.lbl_count)
@@ -233,14 +963,18 @@ class MPVPlayer(QMainWindow):
         right_layout = QVBoxLayout(right_panel)
         right_layout.setContentsMargins(5, 0, 0, 0)
 
+        # Шапка (плейлист + название канала) скрывается в полноэкранном режиме одним вызовом
+        self.header_container = QWidget()
+        header_layout = QVBoxLayout(self.header_container)
+        header_layout.setContentsMargins(0, 0, 0, 0)
+
         # 1. Playlist Controls (Обернули в контейнер)
-        self.pl_container = QWidget()  # <--- Контейнер для скрытия
+        self.pl_container = QWidget()
         pl_layout = QHBoxLayout(self.pl_container)
         pl_layout.setContentsMargins(0, 0, 0, 0)
         
         self.combo_pl = QComboBox()
         self.combo_pl.activated.connect(self.on_playlist_change)
-        self.combo_pl.setStyleSheet(f"background: {COLORS['btn']}; color: white;")
         
         btn_update = make_btn("🔄", self.on_update_click, "Обновить", "fa5s.sync")
         btn_add = make_btn("➕", self.add_playlist_dialog, "Добавить", "fa5s.plus")
@@ -250,23 +984,24 @@ class MPVPlayer(QMainWindow):
         pl_layout.addWidget(self.combo_pl, 1)
         self.cb_autoupdate = QCheckBox("Авто")
         self.cb_autoupdate.setToolTip("Автообновление текущего плейлиста при запуске")
-        self.cb_autoupdate.clicked.connect(self._save_state) # Сохраняем состояние при клике
+        self.cb_autoupdate.clicked.connect(lambda: self._save_state()) # clicked(bool) не должен попасть в last_pl
         pl_layout.addWidget(self.cb_autoupdate)
         pl_layout.addWidget(btn_update)
         pl_layout.addWidget(btn_add)
         pl_layout.addWidget(btn_del)
         
-        right_layout.addWidget(self.pl_container) # Добавляем контейнер, а не layout
+        header_layout.addWidget(self.pl_container) # Добавляем контейнер, а не layout
 
         # 2. Channel Title
         self.lbl_title = QLabel("Выберите канал")
-        self.lbl_title.setStyleSheet("font-size: 14pt; font-weight: bold; padding: 5px;")
+        self.lbl_title.setObjectName("channelTitle")
         self.lbl_title.setAlignment(Qt.AlignCenter)
-        right_layout.addWidget(self.lbl_title)
+        header_layout.addWidget(self.lbl_title)
+        right_layout.addWidget(self.header_container)
 
         # 3. Video Area
         self.video_frame = QWidget()
-        self.video_frame.setStyleSheet("background: black;")
+        self.video_frame.setObjectName("videoFrame")
         self.video_frame.mouseDoubleClickEvent = lambda e: self.toggle_fullscreen()
         right_layout.addWidget(self.video_frame, 1)
 
@@ -318,8 +1053,7 @@ class MPVPlayer(QMainWindow):
         # Теперь здесь только виджеты, которые умеют делать .hide()
         self.ui_elements = [
             left_panel, 
-            self.pl_container,       # Верхняя панель плейлиста
-            self.lbl_title,          # Заголовок
+            self.header_container,   # Панель плейлиста и заголовок
             #self.controls_container, # Нижняя панель кнопок
             self.status_label        # Статус бар
         ]
@@ -327,21 +1061,27 @@ class MPVPlayer(QMainWindow):
     def load_playlists_data(self):
         """Загрузка метаданных плейлистов"""
         auto_update_enabled = False
+        loaded = False
         if os.path.exists(PLAYLISTS_JSON):
             try:
-                with open(PLAYLISTS_JSON, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    self.playlists_data = data.get('playlists', {})
-                    last = data.get('last_playlist')
-                    # Загружаем состояние автообновления
-                    auto_update_enabled = data.get('auto_update', False)
+                data = load_json(PLAYLISTS_JSON)
+                self.playlists_data = data.get('playlists', {})
+                last = data.get('last_playlist')
+                # Загружаем состояние автообновления
+                auto_update_enabled = data.get('auto_update', False)
+                loaded = True
             except Exception:
                 self.playlists_data = {}
                 last = None
         else:
             last = None
+        self._last_playlist = last
         # Устанавливаем галочку в UI
         self.cb_autoupdate.setChecked(auto_update_enabled)    
+        if loaded:
+            # Хэш того, что записал бы _flush_state: первый _save_state с тем же
+            # last_playlist после запуска не перепишет файл
+            self._saved_digest = hashlib.blake2b(self._state_payload(), digest_size=16).digest()
         self._refresh_playlist_combo()
         
         # Восстановление последнего плейлиста
@@ -352,95 +1092,69 @@ class MPVPlayer(QMainWindow):
             target_pl = list(self.playlists_data.keys())[0]
             
         if target_pl:
-            idx = self.combo_pl.findText(self.playlists_data[target_pl]['name'])
+            idx = self.combo_pl.findData(target_pl)
             if idx >= 0:
                 self.combo_pl.setCurrentIndex(idx)
                 
+                # Сразу показываем сохраненную копию, а сеть трогаем уже после
+                # первой отрисовки и загрузки списка
+                self.load_playlist_file(target_pl)
+                
                 # === ЛОГИКА АВТООБНОВЛЕНИЯ ===
                 # Если галочка стоит И у плейлиста есть URL -> обновляем
                 if auto_update_enabled and 'url' in self.playlists_data[target_pl]:
-                    print("Автообновление запущено...")
-                    self.status_label.setText("Автообновление плейлиста...")
-                    # Вызываем загрузку из сети
-                    self._download_playlist(
-                        self.playlists_data[target_pl]['url'], 
-                        self.playlists_data[target_pl]['name']
-                    )
-                else:
-                    # Иначе просто грузим файл с диска
-                    self.load_playlist_file(target_pl)
+                    QTimer.singleShot(AUTOUPDATE_DELAY_MS, lambda: self._maybe_autoupdate(target_pl))
+
+    def _maybe_autoupdate(self, filename):
+        # Плейлист удалили или пользователь уже выбрал другой - не перехватываем выбор
+        if filename not in self.playlists_data or self.combo_pl.currentData() != filename:
+            return
+        print("Автообновление запущено...")
+        self.status_label.setText("Автообновление плейлиста...")
+        pl = self.playlists_data[filename]
+        self._download_playlist(pl['url'], pl['name'], filename)
                     
     def load_playlist_file(self, filename):
-        """Парсинг M3U файла"""
+        """Запуск фонового парсинга M3U файла"""
         if not os.path.exists(filename):
             self.status_label.setText("Файл плейлиста не найден")
             return
 
-        self.channels.clear()
-        self.categories = {"Все каналы": []}
-        
-        try:
-            with open(filename, 'r', encoding='utf-8', errors='ignore') as f:
-                lines = f.readlines()
-                
-            name, group, logo = None, "Разное", None
-            
-            for line in lines:
-                line = line.strip()
-                if not line: continue
-                
-                if line.startswith("#EXTINF"):
-                    # group-title="..."
-                    g_start = line.find('group-title="')
-                    if g_start != -1:
-                        g_end = line.find('"', g_start + 13)
-                        group = line[g_start+13:g_end]
-                    else:
-                        group = "Разное"
-                    
-                    # tvg-logo="..."
-                    l_start = line.find('tvg-logo="')
-                    if l_start != -1:
-                        l_end = line.find('"', l_start + 10)
-                        logo = line[l_start+10:l_end]
-                    else:
-                        logo = None
-                    
-                    # Имя канала (после запятой)
-                    comma = line.rfind(',')
-                    name = line[comma+1:].strip() if comma != -1 else "Неизвестный канал"
-                    
-                elif not line.startswith("#"):
-                    if name:
-                        ch = Channel(name, line, group, logo)
-                        self.channels.append(ch)
-                        self.categories["Все каналы"].append(ch)
-                        
-                        if group not in self.categories:
-                            self.categories[group] = []
-                        self.categories[group].append(ch)
-                        
-                        name = None # Сброс
+        self._loading_playlist = filename
+        self.status_label.setText("Загрузка плейлиста...")
+        self.progress_bar.setRange(0, 0)
+        self.progress_bar.setVisible(True)
 
-            self.update_categories_ui()
-            self.filter_channels()
-            self.status_label.setText(f"Загружено {len(self.channels)} каналов")
-            
-            # Сохраняем как последний
-            self._save_state(last_pl=filename)
+        self._playlist_pool.clear()  # Еще не начатый парсинг прошлого выбора не нужен
+        self._playlist_pool.start(PlaylistLoadTask(filename, self._playlist_signals))
 
-        except Exception as e:
-            self.status_label.setText(f"Ошибка парсинга: {e}")
+    def _on_playlist_loaded(self, filename, table: ChannelTable):
+        # Пользователь уже переключился на другой плейлист
+        if filename != self._loading_playlist:
+            return
+
+        self.progress_bar.setVisible(False)
+        self.icon_downloader.cancel_all()  # Логотипы прошлого плейлиста больше не нужны
+        self.table = table
+
+        self.update_categories_ui()
+        self.filter_channels()
+        self.status_label.setText(f"Загружено {len(self.table)} каналов")
+
+        # Сохраняем как последний
+        self._save_state(last_pl=filename)
+
+    def _on_playlist_failed(self, filename, error):
+        if filename == self._loading_playlist:
+            self.progress_bar.setVisible(False)
+            self.status_label.setText(f"Ошибка парсинга: {error}")
 
     # === LOGIC: UI UPDATES ===
     def update_categories_ui(self):
         self.combo_cat.blockSignals(True)
         self.combo_cat.clear()
-        cats = sorted(self.categories.keys())
-        if "Все каналы" in cats:
-            cats.remove("Все каналы")
-            cats.insert(0, "Все каналы")
-        self.combo_cat.addItems(cats)
+        self.combo_cat.addItem(CATEGORY_ALL)
+        self.combo_cat.addItems(sorted(self.table.groups))
         self.combo_cat.blockSignals(False)
 
     def filter_channels(self, *args):
@@ -451,68 +1165,19 @@ class MPVPlayer(QMainWindow):
         cat = self.combo_cat.currentText()
         search = self.search_input.text().lower()
         
-        if cat not in self.categories: return
+        # Пустая строка - тоже группа (group-title=""), поэтому проверяем индекс, а не текст
+        if self.combo_cat.currentIndex() < 0: return
         
-        source_list = self.categories[cat]
-        self.list_widget.clear()
-        
-        count = 0
-        for ch in source_list:
-            if search and search not in ch.name.lower():
-                continue
-            
-            item = QListWidgetItem(ch.name)
-            item.setData(Qt.UserRole, ch)
-            
-            item.setIcon(self.default_icon)
-            if ch.logo:
-                self._load_icon_async(ch.logo, item)
-            
-            self.list_widget.addItem(item)
-            count += 1
-            if count > 500 and search == "": 
-                break 
-
-        self.lbl_count.setText(f"{count} / {len(source_list)}")
-
-    # === LOGIC: ASYNC ICONS (QNAM) ===
-    def _create_default_icon(self):
-        pix = QPixmap(32, 32)
-        pix.fill(Qt.transparent)
-        return QIcon(pix)
-
-    def _load_icon_async(self, url, item):
-        if url in self.icon_cache:
-            item.setIcon(self.icon_cache[url])
-            return
+        group = None if cat == CATEGORY_ALL else cat
+        # Весь список без ограничения: QListView рисует только видимые строки
+        rows = self.table.search(search, group)
 
-        req = QNetworkRequest(QUrl(url))
-        req.setRawHeader(b"User-Agent", USER_AGENT)
-        # Принудительно отключаем HTTP/2 (используем HTTP/1.1)
-        req.setAttribute(QNetworkRequest.Attribute.Http2AllowedAttribute, False)
-        
-        reply = self.nam.get(req)
-        # Дополнительная защита от SSL ошибок (часто бывает у IPTV провайдеров)
-        reply.sslErrors.connect(reply.ignoreSslErrors)
-        reply.finished.connect(lambda: self._on_icon_loaded(reply, url, item))
-
-    def _on_icon_loaded(self, reply: QNetworkReply, url: str, item: QListWidgetItem):
-        reply.deleteLater()
-        if reply.error() == QNetworkReply.NoError:
-            data = reply.readAll()
-            pix = QPixmap()
-            if pix.loadFromData(data):
-                icon = QIcon(pix)
-                self.icon_cache[url] = icon
-                try:
-                    if item.listWidget(): 
-                        item.setIcon(icon)
-                except:
-                    pass
+        self.channel_model.set_rows(self.table, rows)
+        self.lbl_count.setText(f"{len(rows)} / {self.table.count(group)}")
 
     # === LOGIC: PLAYBACK ===
-    def on_channel_click(self, item):
-        ch: Channel = item.data(Qt.UserRole)
+    def on_channel_click(self, index: QModelIndex):
+        ch: Channel = index.data(Qt.UserRole)
         self.play_channel(ch)
 
     def play_channel(self, ch: Channel):
@@ -542,14 +1207,15 @@ class MPVPlayer(QMainWindow):
         if hasattr(self, 'vol_label'):
             self.vol_label.setText(f"{val}%")
             
-        if self.mpv_player:
-            self.mpv_player.volume = val
+        self._pending_vol = val
+        self._vol_timer.start()
+
+    def _flush_volume(self):
+        if self.mpv_player and self._pending_vol is not None:
+            self.mpv_player.volume = self._pending_vol
 
     def toggle_fullscreen(self):
-        # Переключаем флаг
-        self.is_fullscreen = not self.is_fullscreen
-        
-        if self.is_fullscreen:
+        if not self.isFullScreen():
             # === ВХОД В ПОЛНЫЙ ЭКРАН ===
             
             # 1. Запоминаем текущее состояние перед входом
@@ -559,39 +1225,52 @@ class MPVPlayer(QMainWindow):
             if not self.was_maximized:
                 self.previous_geometry = self.saveGeometry()
 
-            # 2. Скрываем элементы интерфейса
-            for w in self.ui_elements:
-                if isinstance(w, QWidget): w.hide()
-            
-            # 3. Включаем полноэкранный режим
+            # 2. Включаем полноэкранный режим (интерфейс скрывает changeEvent)
             self.showFullScreen()
             
         else:
             # === ВЫХОД ИЗ ПОЛНОГО ЭКРАНА ===
-            
-            # 1. Возвращаем элементы интерфейса
-            for w in self.ui_elements:
-                if isinstance(w, QWidget): w.show()
-            
-            # 2. Восстанавливаем состояние окна
             if self.was_maximized:
                 self.showMaximized()
             else:
                 self.showNormal()
-                # Восстанавливаем точные размеры и положение, если они были сохранены
-                if self.previous_geometry:
-                    self.restoreGeometry(self.previous_geometry)
+                # Геометрию применяем после того, как Qt обработает выход из полноэкранного режима
+                QTimer.singleShot(0, self._post_fullscreen)
+
+    def changeEvent(self, event):
+        # Флаг берем из фактического состояния окна: оно верно и тогда,
+        # когда полноэкранный режим сняла ОС, а не наша кнопка
+        if event.type() == QEvent.WindowStateChange:
+            full = bool(self.windowState() & Qt.WindowFullScreen)
+            if full != self.is_fullscreen:
+                self.is_fullscreen = full
+                for w in self.ui_elements:
+                    w.setVisible(not full)
+        super().changeEvent(event)
+
+    def _post_fullscreen(self):
+        # Восстанавливаем точные размеры и положение, если они были сохранены
+        if not self.is_fullscreen and self.previous_geometry:
+            self.restoreGeometry(self.previous_geometry)
                     
+    # Горячие клавиши: код клавиши -> имя метода
+    _KEY_ACTIONS = {
+        Qt.Key_F11: 'toggle_fullscreen',
+        Qt.Key_Escape: '_exit_fullscreen',
+        Qt.Key_Space: 'play_current',
+    }
+
     def keyPressEvent(self, event: QKeyEvent):
-        if event.key() == Qt.Key_F11:
-            self.toggle_fullscreen()
-        elif event.key() == Qt.Key_Escape and self.is_fullscreen:
-            self.toggle_fullscreen()
-        elif event.key() == Qt.Key_Space:
-            self.play_current()
+        action = self._KEY_ACTIONS.get(event.key())
+        if action:
+            getattr(self, action)()
         else:
             super().keyPressEvent(event)
 
+    def _exit_fullscreen(self):
+        if self.is_fullscreen:
+            self.toggle_fullscreen()
+
     # === LOGIC: PLAYLIST MANAGEMENT ===
     def add_playlist_dialog(self):
         d = QDialog(self)
@@ -620,12 +1299,13 @@ class MPVPlayer(QMainWindow):
         l2 = QVBoxLayout(t2)
         fname_lbl = QLabel("Файл не выбран")
         btn_f = QPushButton("Выбрать файл")
-        self._temp_path = None
+        picked_path = None  # Живет в замыкании диалога, а не на окне
         
         def pick_f():
+            nonlocal picked_path
             path, _ = QFileDialog.getOpenFileName(d, "Выбрать M3U", "", "Playlist (*.m3u *.m3u8)")
             if path:
-                self._temp_path = path
+                picked_path = path
                 fname_lbl.setText(os.path.basename(path))
         
         btn_f.clicked.connect(pick_f)
@@ -647,52 +1327,83 @@ class MPVPlayer(QMainWindow):
             if tabs.currentIndex() == 0:
                 self._download_playlist(url_edit.text(), name_edit.text())
             else:
-                if self._temp_path:
-                    self._import_local_playlist(self._temp_path, name_edit_f.text())
+                if picked_path:
+                    self._import_local_playlist(picked_path, name_edit_f.text())
 
-    def _download_playlist(self, url, name):
+    def _download_playlist(self, url, name, filename=None):
+        """filename - файл обновляемого плейлиста; None - новый плейлист"""
         if not url: return
         self.status_label.setText("Скачивание плейлиста...")
         
-        req = QNetworkRequest(QUrl(url))
-        req.setRawHeader(b"User-Agent", USER_AGENT)
-        # === (ОТКЛЮЧЕНИЕ HTTP/2) ===
-        req.setAttribute(QNetworkRequest.Attribute.Http2AllowedAttribute, False)
+        req = make_request(url)
+        # Иначе "Обновить" вернет старую копию из кэша, не обратившись к серверу
+        _require_revalidation(self.nam.cache(), req.url())
         reply = self.nam.get(req)
-        
+        reply.downloadProgress.connect(self._on_download_progress)
+
+        # Пишем на диск по мере прихода данных, а не держим весь M3U в памяти
+        tmp = tempfile.NamedTemporaryFile(dir='.', suffix='.tmp', delete=False)
+
+        def on_chunk():
+            tmp.write(reply.readAll().data())
+
         def on_dl():
-            reply.deleteLater()
+            self.progress_bar.setVisible(False)
+            on_chunk()
+            tmp.close()
             if reply.error() == QNetworkReply.NoError:
-                data = reply.readAll()
-                filename = f"playlist_{int(time.time())}.m3u"
-                with open(filename, 'wb') as f:
-                    f.write(data.data())
+                # Обновление перезаписывает свой файл, а не плодит копию в списке
+                target = filename or next_playlist_filename("playlist")
+                os.replace(tmp.name, target)
                 
                 real_name = name or "Web Playlist"
-                self.playlists_data[filename] = {'name': real_name, 'url': url}
+                self.playlists_data[target] = {'name': real_name, 'url': url}
                 self._save_state()
                 self._refresh_playlist_combo()
                 
-                idx = self.combo_pl.findText(real_name)
-                self.combo_pl.setCurrentIndex(idx)
-                self.load_playlist_file(filename)
+                self.combo_pl.setCurrentIndex(self.combo_pl.findData(target))
+                self.load_playlist_file(target)
             else:
+                os.remove(tmp.name)
                 QMessageBox.warning(self, "Ошибка", f"Не удалось скачать: {reply.errorString()}")
 
+        reply.readyRead.connect(on_chunk)
         reply.finished.connect(on_dl)
 
+    def _on_download_progress(self, received, total):
+        self.progress_bar.setVisible(True)
+        if total > 0:
+            self.progress_bar.setRange(0, total)
+            self.progress_bar.setValue(received)
+        else:
+            self.progress_bar.setRange(0, 0)  # Размер неизвестен
+
     def _import_local_playlist(self, path, name):
-        import shutil
-        filename = f"local_{int(time.time())}.m3u"
-        shutil.copy(path, filename)
-        
+        filename = next_playlist_filename("local")
+        open(filename, 'xb').close()  # Занимаем имя сразу, пока идет копирование
+        self.status_label.setText("Импорт плейлиста...")
         real_name = name or os.path.basename(path)
+        # Копия большого файла (или с сетевого диска) не должна морозить окно
+        self._importing.add(filename)
+        self._import_pool.start(
+            PlaylistImportTask(path, filename, real_name, self._playlist_signals))
+
+    def _on_playlist_imported(self, filename, real_name, error):
+        self._importing.discard(filename)
+        if error:
+            try:
+                os.remove(filename)
+            except OSError:
+                pass
+            self.status_label.setText("Готов")
+            QMessageBox.warning(self, "Ошибка", f"Не удалось импортировать: {error}")
+            return
+
         self.playlists_data[filename] = {'name': real_name}
         self._save_state()
         self._refresh_playlist_combo()
         
-        idx = self.combo_pl.findText(real_name)
-        self.combo_pl.setCurrentIndex(idx)
+        self.combo_pl.setCurrentIndex(self.combo_pl.findData(filename))
         self.load_playlist_file(filename)
 
     def on_update_click(self):
@@ -700,14 +1411,10 @@ class MPVPlayer(QMainWindow):
         if curr_idx < 0: return
         
         curr_name = self.combo_pl.currentText()
-        filename = None
-        for k, v in self.playlists_data.items():
-            if v['name'] == curr_name:
-                filename = k
-                break
+        filename = self.combo_pl.currentData()
         
         if filename and 'url' in self.playlists_data[filename]:
-            self._download_playlist(self.playlists_data[filename]['url'], curr_name)
+            self._download_playlist(self.playlists_data[filename]['url'], curr_name, filename)
         else:
             QMessageBox.information(self, "Инфо", "Это локальный плейлист, обновление только для веб-ссылок.")
 
@@ -718,51 +1425,81 @@ class MPVPlayer(QMainWindow):
         if QMessageBox.question(self, "Удалить?", f"Удалить плейлист {curr_name}?") != QMessageBox.Yes:
             return
 
-        filename = None
-        for k, v in self.playlists_data.items():
-            if v['name'] == curr_name:
-                filename = k
-                break
+        filename = self.combo_pl.currentData()
         
         if filename:
             del self.playlists_data[filename]
+            # Кэш разбора удаленного плейлиста больше не прочитают
+            try:
+                os.remove(filename + PLAYLIST_CACHE_EXT)
+            except FileNotFoundError:
+                pass
+            if self._last_playlist == filename:
+                self._last_playlist = None
+            # Разбор удаленного плейлиста еще идет - его результат не нужен.
+            # Сбрасываем до обновления списка: он сам запустит загрузку следующего плейлиста
+            self._loading_playlist = None
+            self.progress_bar.setVisible(False)
+            self.icon_downloader.cancel_all()
+            self.table = ChannelTable([])
+            self.update_categories_ui()
+            self.filter_channels()
             self._save_state()
             self._refresh_playlist_combo()
-            self.channels.clear()
-            self.list_widget.clear()
 
     def _refresh_playlist_combo(self):
         self.combo_pl.clear()
         for k, v in self.playlists_data.items():
-            self.combo_pl.addItem(v['name'])
+            self.combo_pl.addItem(v['name'], k)  # userData - имя файла плейлиста
 
     def on_playlist_change(self, idx):
         if idx < 0: return
-        name = self.combo_pl.itemText(idx)
-        for k, v in self.playlists_data.items():
-            if v['name'] == name:
-                self.load_playlist_file(k)
-                return
+        filename = self.combo_pl.itemData(idx)
+        if filename:
+            self.load_playlist_file(filename)
 
     def _save_state(self, last_pl=None):
+        if last_pl:
+            self._last_playlist = last_pl
+        self._save_timer.start()
+
+    def _state_payload(self) -> bytes:
         data = {'playlists': self.playlists_data}
         if hasattr(self, 'cb_autoupdate'):
             data['auto_update'] = self.cb_autoupdate.isChecked()
-        if last_pl:
-            data['last_playlist'] = last_pl
-        elif os.path.exists(PLAYLISTS_JSON):
-             try:
-                 with open(PLAYLISTS_JSON, 'r') as f:
-                     old = json.load(f)
-                     data['last_playlist'] = old.get('last_playlist')
-             except: pass
-             
-        with open(PLAYLISTS_JSON, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2)
+        if self._last_playlist:
+            data['last_playlist'] = self._last_playlist
+        return dump_json(data)
+
+    def _flush_state(self):
+        self._save_timer.stop()
+        # Содержимое не изменилось (например, тот же last_playlist) - не пишем
+        payload = self._state_payload()
+        digest = hashlib.blake2b(payload, digest_size=16).digest()
+        if digest == self._saved_digest:
+            return
+        write_atomic(PLAYLISTS_JSON, payload)
+        self._saved_digest = digest
 
     def closeEvent(self, event):
+        # Дожидаемся фоновых загрузчиков, иначе Qt упадет при уничтожении потока
+        self._playlist_pool.clear()
+        self._playlist_pool.waitForDone()
+        self._import_pool.clear()
+        self._import_pool.waitForDone()
+        # Импорт не успел попасть в playlists_data - зарезервированный файл никому не нужен
+        for filename in self._importing:
+            try:
+                os.remove(filename)
+            except OSError:
+                pass
+        if self._save_timer.isActive():
+            self._flush_state()
         if self.mpv_player:
-            self.mpv_player.terminate()
+            # terminate() может зависнуть на заглохшем потоке - не держим окно дольше таймаута
+            stopper = threading.Thread(target=self.mpv_player.terminate, daemon=True)
+            stopper.start()
+            stopper.join(MPV_TERMINATE_TIMEOUT_S)
         event.accept()
 
 if __name__ == "__main__":
@@ -777,11 +1514,12 @@ if __name__ == "__main__":
 
     app = QApplication(sys.argv)
     app.setStyle('Fusion')
+    app.setStyleSheet(STYLESHEET)
     
     # === УСТАНОВКА ГЛОБАЛЬНОЙ ИКОНКИ ПРИЛОЖЕНИЯ ===
     app_icon_path = os.path.join(SCRIPT_DIR, "iptv.ico")
     if os.path.exists(app_icon_path):
-        app.setWindowIcon(QIcon(app_icon_path))
+        app.setWindowIcon(IconCache.file(app_icon_path))
     # ==============================================
 
     player = MPVPlayer()